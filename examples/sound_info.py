@@ -5,17 +5,34 @@ import json
 import sys
 import time
 import csv
+import collections
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Get ms_token from environment variable or use a known working one
 ms_token = os.environ.get("ms_token", None)  # set your own ms_token
 
 # Global API instance to reuse across calls
 api_instance = None
-# Track when we last made a request to avoid rate limiting
-last_request_time = 0
-# Minimum delay between requests (in seconds)
-MIN_REQUEST_DELAY = 0.1
+# Maximum number of sound requests in flight at once
+CONCURRENCY = 16
+# At most RATE_LIMIT requests are sent in any RATE_WINDOW seconds
+RATE_LIMIT = 10
+RATE_WINDOW = 1.0
+
+# Send times of the most recent requests and the lock guarding them,
+# the lock is created on first use inside the running event loop
+request_times = collections.deque(maxlen=RATE_LIMIT)
+rate_lock = None
 
 async def initialize_api():
     """Initialize the API once and reuse it"""
@@ -48,32 +65,40 @@ async def initialize_api():
     
     return api_instance
 
+async def acquire_rate_limit_slot():
+    """Wait until sending another request stays within RATE_LIMIT per RATE_WINDOW"""
+    global rate_lock
+    if rate_lock is None:
+        rate_lock = asyncio.Lock()
+    async with rate_lock:
+        now = time.monotonic()
+        if len(request_times) == RATE_LIMIT and now - request_times[0] < RATE_WINDOW:
+            await asyncio.sleep(RATE_WINDOW - (now - request_times[0]))
+        request_times.append(time.monotonic())
+
 async def sound_info(sound_id, retry_count=1):
     """Get sound info for a specific sound ID with retry logic"""
-    global last_request_time
     start_time = time.time()
     
-    # Add a small delay between requests to avoid rate limiting
-    elapsed_since_last = start_time - last_request_time
-    if last_request_time > 0 and elapsed_since_last < MIN_REQUEST_DELAY:
-        delay = MIN_REQUEST_DELAY - elapsed_since_last
-        await asyncio.sleep(delay)
-    
     attempts = 0
     while attempts <= retry_count:
         try:
             api = await initialize_api()
+            await acquire_rate_limit_slot()
             sound = api.sound(id=sound_id)
             sound_details = await sound.info()
             
             elapsed = time.time() - start_time
-            last_request_time = time.time()
             
             print(f"Retrieved sound info for {sound_id} in {elapsed:.2f} seconds")
             
             # Save to file with sound ID in filename
-            with open(f"sound_info_{sound_id}.json", "w") as f:
-                json.dump(sound_details, f, indent=4)
+            if orjson is not None:
+                with open(f"sound_info_{sound_id}.json", "wb") as f:
+                    f.write(orjson.dumps(sound_details, option=orjson.OPT_INDENT_2))
+            else:
+                with open(f"sound_info_{sound_id}.json", "w") as f:
+                    json.dump(sound_details, f, indent=2)
                 
             return sound_details, elapsed
         
@@ -88,8 +113,8 @@ async def sound_info(sound_id, retry_count=1):
                 print(f"Failed to retrieve sound {sound_id} after {retry_count} retries: {str(e)} in {elapsed:.2f} seconds")
                 return None, elapsed
 
-async def process_multiple_sounds(sound_ids, max_sounds=None, output_csv=None):
-    """Process multiple sound IDs sequentially, reusing the same session"""
+async def process_multiple_sounds(sound_ids, max_sounds=None, output_csv=None, concurrency=CONCURRENCY):
+    """Process multiple sound IDs concurrently, reusing the same session"""
     results = []
     total_start_time = time.time()
     
@@ -105,10 +130,22 @@ async def process_multiple_sounds(sound_ids, max_sounds=None, output_csv=None):
         csv_writer = csv.writer(csv_file)
         csv_writer.writerow(['sound_id', 'timestamp', 'time_taken', 'success'])
     
-    try:
-        for i, sound_id in enumerate(sound_ids):
-            print(f"Processing sound {i+1}/{len(sound_ids)}: {sound_id}")
+    # Make sure the shared session exists before the requests fan out
+    await initialize_api()
+    
+    # Bound the number of requests in flight at once
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def _one(sound_id):
+        async with semaphore:
             result, time_taken = await sound_info(sound_id)
+            return sound_id, result, time_taken
+    
+    try:
+        tasks = [asyncio.create_task(_one(sound_id)) for sound_id in sound_ids]
+        for i, coro in enumerate(asyncio.as_completed(tasks)):
+            sound_id, result, time_taken = await coro
+            print(f"Processed sound {i+1}/{len(sound_ids)}: {sound_id}")
             success = result is not None
             timestamp = datetime.now().isoformat()
             
@@ -139,6 +176,13 @@ async def main():
         # Check if we're processing a single sound ID or multiple from the CSV
         if len(sys.argv) > 1:
             if sys.argv[1] == "--batch":
+                # Determine how many sounds to process
+                max_sounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+                concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else CONCURRENCY
+                if concurrency < 1:
+                    print("Usage: python sound_info.py --batch [count] [concurrency], concurrency must be at least 1")
+                    return
+                
                 # Process sounds from the CSV file
                 sound_ids = []
                 with open("sounds_ids.csv", "r") as f:
@@ -147,14 +191,11 @@ async def main():
                         if sound_id:
                             sound_ids.append(sound_id)
                 
-                # Determine how many sounds to process
-                max_sounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
-                
                 # Create output CSV filename with timestamp
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 output_csv = f"sound_results_{timestamp}.csv"
                 
-                await process_multiple_sounds(sound_ids, max_sounds, output_csv)
+                await process_multiple_sounds(sound_ids, max_sounds, output_csv, concurrency)
             else:
                 # Process a single sound ID
                 sound_id = sys.argv[1]
@@ -175,4 +216,11 @@ async def main():
                 print(f"Error during cleanup: {str(e)}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is None:
+        asyncio.run(main())
+    elif sys.version_info >= (3, 11):
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            runner.run(main())
+    else:
+        uvloop.install()
+        asyncio.run(main())
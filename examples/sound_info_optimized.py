@@ -1,27 +1,60 @@
 #!/usr/bin/env python3
 """
 TikTok Sound Info - Optimized for high-volume API calls
-This script efficiently retrieves sound information from TikTok by reusing browser sessions.
-It can process millions of sound IDs per day with minimal overhead.
+This script efficiently retrieves sound information from TikTok by reusing a pool of browser sessions.
+It can process millions of sound IDs per day with minimal overhead: the browser
+sessions only sign the request URLs, the requests themselves are plain HTTP.
 
 Usage:
   python sound_info_optimized.py <sound_id>                # Process a single sound
   python sound_info_optimized.py --batch <count>           # Process multiple sounds from sounds_ids.csv
   python sound_info_optimized.py --file <filename> <count> # Process sounds from a specific file
+
+Batch modes run up to --concurrency requests at once (default: 16), signed
+by --sessions browser sessions (default: 2). Pass --jsonl [FILE] to append
+every result to a single JSON Lines file (default: sound_info.jsonl) instead
+of writing one JSON file per sound. Sounds saved in --output-dir within the
+last 24 hours are loaded from disk instead of fetched again, unless --force
+is given. With --jsonl no per-sound files are written, so only files left by
+earlier runs without it are reused; cached sounds are still written to the
+JSON Lines file.
+
+The ms_token environment variable may hold several comma separated tokens,
+which are assigned to the browser sessions in turn.
+
+Requires the examples extra: pip install "TikTokApi[examples]"
 """
 
 from TikTokApi import TikTokApi
+from TikTokApi.exceptions import EmptyResponseException, InvalidJSONException, InvalidResponseException
 import asyncio
 import os
 import json
 import sys
 import time
-import csv
 import logging
 import signal
 import argparse
+import collections
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+import random
+import aiofiles
+import httpx
 from datetime import datetime
 from pathlib import Path
+from typing import Any
+from urllib.parse import urlencode, quote, urlparse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Configure logging
 logging.basicConfig(
@@ -34,51 +67,140 @@ logging.basicConfig(
 )
 logger = logging.getLogger("sound_info")
 
-# Get ms_token from environment variable
-ms_token = os.environ.get("ms_token", None)
+# httpx logs every request at INFO level
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
-# Global API instance to reuse across calls
-api_instance = None
+# Get the ms_tokens from the environment variable, several may be given separated by commas
+ms_tokens = [token.strip() for token in os.environ.get("ms_token", "").split(",") if token.strip()]
 
-# Track when we last made a request to avoid rate limiting
-last_request_time = 0
+# Endpoint returning the sound details JSON
+SOUND_DETAIL_URL = "https://www.tiktok.com/api/music/detail/"
 
-# Minimum delay between requests (in seconds)
-MIN_REQUEST_DELAY = 0.1
+# Domains (and their subdomains) the browser sessions may load resources from,
+# everything else (analytics, ads, beacons) is blocked
+ALLOWED_DOMAINS = ("tiktok.com", "tiktokcdn.com", "tiktokcdn-us.com", "tiktokv.com", "ttwstatic.com")
 
-# Flag to indicate if we're shutting down
-shutting_down = False
+# Number of results buffered before they are written to the CSV and JSON Lines files
+RESULTS_BATCH_SIZE = 64
 
-def signal_handler(sig, frame):
-    """Handle interrupt signals gracefully"""
-    global shutting_down
-    if shutting_down:
-        logger.warning("Forced exit requested, terminating immediately")
-        sys.exit(1)
-    
-    logger.warning("Interrupt received, finishing current task and shutting down...")
-    shutting_down = True
+# Buffered results are written at least this often (in seconds)
+RESULTS_FLUSH_INTERVAL = 1.0
+
+# Per-attempt timeout for a sound request (in seconds)
+REQ_TIMEOUT = 15.0
+
+# Upper bound for the delay between retries (in seconds)
+MAX_RETRY_DELAY = 30
+
+# Saved sound files younger than this are reused instead of fetched again (in seconds)
+CACHE_TTL = 24 * 60 * 60
+
+# Number of recently fetched sounds kept in memory
+MEM_CACHE_SIZE = 1024
+
+# Default number of browser sessions to create, they are only used to sign URLs
+# so a few of them keep up with many concurrent requests
+NUM_SESSIONS = 2
+
+# Default number of sound requests in flight at once
+CONCURRENCY = 16
+
+# At most RATE_LIMIT requests are sent in any RATE_WINDOW seconds
+RATE_LIMIT = 10
+RATE_WINDOW = 1.0
 
-# Register signal handlers
-signal.signal(signal.SIGINT, signal_handler)
-signal.signal(signal.SIGTERM, signal_handler)
+@dataclasses.dataclass
+class PipelineCtx:
+    """The state of one sound info pipeline, must be created inside the running event loop"""
 
-async def initialize_api():
+    output_dir: str = "sound_data"
+    retry_count: int = 1
+    force: bool = False
+    concurrency: int = CONCURRENCY
+    api: TikTokApi = None
+    # Shared HTTP client for the sound detail requests, the browser only signs the URLs
+    http_client: httpx.AsyncClient = None
+    # Request headers (including cookies) harvested from each browser session
+    session_headers: list = dataclasses.field(default_factory=list)
+    # Indexes of the browser sessions that are currently free to sign a URL
+    session_pool: asyncio.Queue = dataclasses.field(default_factory=asyncio.Queue)
+    # Send times of the most recent requests and the lock guarding them
+    request_times: collections.deque = dataclasses.field(
+        default_factory=lambda: collections.deque(maxlen=RATE_LIMIT)
+    )
+    rate_lock: asyncio.Lock = dataclasses.field(default_factory=asyncio.Lock)
+    # No requests are sent before this time.monotonic() value after TikTok asked us to back off
+    paused_until: float = 0.0
+    # Recently fetched sound details, least recently used first
+    mem_cache: collections.OrderedDict = dataclasses.field(default_factory=collections.OrderedDict)
+    # Shared JSON Lines output file (when --jsonl is used) and the lines waiting to be written to it
+    jsonl_file: Any = None
+    jsonl_buffer: list = dataclasses.field(default_factory=list)
+    # Set once the pipeline should stop starting new requests
+    shutdown: asyncio.Event = dataclasses.field(default_factory=asyncio.Event)
+
+    def __post_init__(self):
+        # Sound file paths are built by appending "<id>.json" to this prefix
+        self.output_prefix = os.path.join(os.fsencode(self.output_dir), b"sound_info_")
+
+    def sound_file_path(self, sound_id):
+        """The path of the JSON file holding the details of a sound, as bytes"""
+        return self.output_prefix + sound_id.encode() + b".json"
+
+    def request_shutdown(self):
+        """Ask the pipeline to stop, a second request terminates immediately"""
+        if self.shutdown.is_set():
+            logger.warning("Forced exit requested, terminating immediately")
+            sys.exit(1)
+        
+        logger.warning("Interrupt received, finishing current task and shutting down...")
+        self.shutdown.set()
+
+def is_allowed_url(url):
+    """Whether a browser session may load the url"""
+    host = urlparse(url).hostname
+    if host is None:
+        return True
+    return any(host == domain or host.endswith("." + domain) for domain in ALLOWED_DOMAINS)
+
+async def block_third_party_requests(route):
+    """Abort requests to hosts outside ALLOWED_DOMAINS"""
+    if is_allowed_url(route.request.url):
+        # Let the resource type filter set up by TikTokApi decide
+        await route.fallback()
+    else:
+        await route.abort()
+
+async def refresh_session_headers(ctx, session_index):
+    """Harvest the current headers and cookies of a browser session for the HTTP requests"""
+    session = ctx.api.sessions[session_index]
+    cookies = await ctx.api.get_session_cookies(session)
+    # The page keeps refreshing msToken, pick up the latest one
+    if cookies.get("msToken"):
+        session.ms_token = cookies["msToken"]
+    
+    headers = dict(session.headers or {})
+    headers["accept"] = "application/json, text/plain, */*"
+    headers["referer"] = "https://www.tiktok.com/"
+    headers["cookie"] = "; ".join(f"{name}={value}" for name, value in cookies.items())
+    ctx.session_headers[session_index] = headers
+
+async def initialize_api(ctx, num_sessions=NUM_SESSIONS):
     """Initialize the API once and reuse it"""
-    global api_instance
-    if api_instance is None:
-        logger.info("Initializing API and creating session...")
+    if ctx.api is None:
+        logger.info(f"Initializing API and creating {num_sessions} sessions...")
         start_time = time.time()
         
-        api_instance = TikTokApi()
+        api = TikTokApi()
         
-        # Create only one session and reuse it
-        # Disable resource types that aren't needed for API calls
+        # Create a pool of sessions, each one is an independent browser context
+        # Disable resource types that aren't needed for API calls, scripts are
+        # still needed because the URLs are signed by TikTok's own javascript
         suppress_resources = ["image", "media", "font", "stylesheet"]
         
-        await api_instance.create_sessions(
-            ms_tokens=[ms_token] if ms_token else None,
-            num_sessions=1,
+        await api.create_sessions(
+            ms_tokens=ms_tokens or None,
+            num_sessions=num_sessions,
             sleep_after=1,
             browser=os.getenv("TIKTOK_BROWSER", "chromium"),
             suppress_resource_load_types=suppress_resources,
@@ -87,127 +209,422 @@ async def initialize_api():
             timeout=15000
         )
         
+        if ms_tokens:
+            # create_sessions() picks a random token for every session, hand
+            # them out in turn instead so each token gets its share of sessions
+            for session_index, session in enumerate(api.sessions):
+                ms_token = ms_tokens[session_index % len(ms_tokens)]
+                session.ms_token = ms_token
+                await api.set_session_cookies(session, [{
+                    "name": "msToken",
+                    "value": ms_token,
+                    "domain": urlparse(session.base_url).netloc,
+                    "path": "/",
+                }])
+        
+        # Stop the pages from loading third party scripts and beacons, the
+        # routes added last are consulted first
+        for session in api.sessions:
+            await session.page.route("**/*", block_third_party_requests)
+        
+        ctx.api = api
+        
+        # Harvest the headers and cookies of each session so the data requests
+        # can be sent over plain HTTP instead of through the browser
+        ctx.session_headers = [None] * len(api.sessions)
+        for session_index in range(len(api.sessions)):
+            await refresh_session_headers(ctx, session_index)
+        
+        ctx.http_client = httpx.AsyncClient(
+            # All requests go to the same host, one kept-alive connection per in-flight request
+            limits=httpx.Limits(max_connections=ctx.concurrency, max_keepalive_connections=ctx.concurrency),
+            timeout=httpx.Timeout(10.0),
+        )
+        
+        # Signing leases a session from the pool and waits when all of them are busy
+        for session_index in range(len(api.sessions)):
+            ctx.session_pool.put_nowait(session_index)
+        
         elapsed = time.time() - start_time
         logger.info(f"API initialization completed in {elapsed:.2f} seconds")
     
-    return api_instance
+    return ctx.api
 
-async def sound_info(sound_id, retry_count=1, output_dir="sound_data"):
-    """Get sound info for a specific sound ID with retry logic"""
-    global last_request_time, shutting_down
+async def sign_sound_url(ctx, sound_id):
+    """Build the sound detail URL and sign it in a leased browser session
+
+    Returns:
+        tuple: The signed URL and the index of the session whose msToken it carries.
+    """
+    session_index = await ctx.session_pool.get()
+    try:
+        session = ctx.api.sessions[session_index]
+        params = {**session.params, "msToken": session.ms_token, "musicId": sound_id}
+        url = f"{SOUND_DETAIL_URL}?{urlencode(params, safe='=', quote_via=quote)}"
+        return await ctx.api.sign_url(url, session_index=session_index), session_index
+    finally:
+        ctx.session_pool.put_nowait(session_index)
+
+async def fetch_sound_details(ctx, sound_id):
+    """Fetch the sound details over HTTP, the browser session is only held while signing the URL"""
+    signed_url, session_index = await sign_sound_url(ctx, sound_id)
+    
+    response = await ctx.http_client.get(signed_url, headers=ctx.session_headers[session_index])
+    if response.status_code == 429:
+        # Hold back every request until TikTok's suggested delay has passed
+        try:
+            delay = float(response.headers.get("retry-after", RATE_WINDOW))
+        except ValueError:
+            delay = RATE_WINDOW
+        delay = min(delay, MAX_RETRY_DELAY)
+        ctx.paused_until = max(ctx.paused_until, time.monotonic() + delay)
+    response.raise_for_status()
+    if not response.content:
+        # Usually an expired msToken, the next attempt uses the session's current cookies
+        await refresh_session_headers(ctx, session_index)
+        raise EmptyResponseException(response.text, "TikTok returned an empty response.")
+    
+    try:
+        data = response.json()
+    except json.JSONDecodeError:
+        raise InvalidJSONException(response.text, "TikTok returned invalid JSON.")
+    
+    if data.get("status_code") != 0:
+        # Error payloads must not end up in the cache, fail the attempt so it is retried
+        raise InvalidResponseException(
+            response.text, f"TikTok returned status code {data.get('status_code')}."
+        )
+    return data
+
+async def acquire_rate_limit_slot(ctx):
+    """Wait until sending another request stays within RATE_LIMIT per RATE_WINDOW"""
+    request_times = ctx.request_times
+    async with ctx.rate_lock:
+        now = time.monotonic()
+        if now < ctx.paused_until:
+            # Wake up early if a shutdown is requested while paused
+            try:
+                await asyncio.wait_for(ctx.shutdown.wait(), timeout=ctx.paused_until - now)
+            except asyncio.TimeoutError:
+                pass
+            now = time.monotonic()
+        if len(request_times) == RATE_LIMIT and now - request_times[0] < RATE_WINDOW:
+            await asyncio.sleep(RATE_WINDOW - (now - request_times[0]))
+        request_times.append(time.monotonic())
+
+def loads(data):
+    """Deserialize JSON from bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def cached_sound_info(ctx, sound_id):
+    """Return the cached details of a sound, or None if it has to be fetched"""
+    mem_cache = ctx.mem_cache
+    cached = mem_cache.get(sound_id)
+    if cached is not None:
+        mem_cache.move_to_end(sound_id)
+    else:
+        cached_file = ctx.sound_file_path(sound_id)
+        try:
+            if time.time() - os.stat(cached_file).st_mtime < CACHE_TTL:
+                with open(cached_file, "rb") as f:
+                    cached = loads(f.read())
+        except (OSError, ValueError):
+            # Missing or unreadable files are simply fetched again
+            pass
     
-    if shutting_down:
+    # Older versions of this script saved TikTok's error answers too, only
+    # successful payloads count as cached
+    if isinstance(cached, dict) and cached.get("status_code") == 0:
+        return cached
+    return None
+
+def remember_sound_info(ctx, sound_id, sound_details):
+    """Keep the details of a fetched sound in the in-memory cache"""
+    mem_cache = ctx.mem_cache
+    mem_cache[sound_id] = sound_details
+    mem_cache.move_to_end(sound_id)
+    if len(mem_cache) > MEM_CACHE_SIZE:
+        mem_cache.popitem(last=False)
+
+def dumps_pretty(obj):
+    """Serialize an object as indented JSON"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode()
+
+def dumps_line(obj):
+    """Serialize an object as one compact line of JSON"""
+    if orjson is not None:
+        return orjson.dumps(obj) + b"\n"
+    return json.dumps(obj, separators=(",", ":")).encode() + b"\n"
+
+def jsonl_line(sound_id, sound_details):
+    """The JSON Lines record of a sound"""
+    return dumps_line({"id": sound_id, "ts": time.time(), "data": sound_details})
+
+def write_sound_file(path, sound_details):
+    """Write the details of a sound to its own JSON file"""
+    data = memoryview(dumps_pretty(sound_details))
+    # Unbuffered write straight to the file descriptor, the payload is already in memory
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+async def sound_info(ctx, sound_id):
+    """Get sound info for a specific sound ID with retry logic"""
+    if ctx.shutdown.is_set():
         logger.info(f"Skipping sound {sound_id} due to shutdown")
         return None, 0
     
-    start_time = time.time()
-    
-    # Add a small delay between requests to avoid rate limiting
-    elapsed_since_last = start_time - last_request_time
-    if last_request_time > 0 and elapsed_since_last < MIN_REQUEST_DELAY:
-        delay = MIN_REQUEST_DELAY - elapsed_since_last
-        await asyncio.sleep(delay)
+    if not ctx.force:
+        cached = cached_sound_info(ctx, sound_id)
+        if cached is not None:
+            logger.info(f"Loaded sound info for {sound_id} from cache")
+            if ctx.jsonl_file is not None:
+                # Cached sounds are part of the JSON Lines output as well
+                ctx.jsonl_buffer.append(jsonl_line(sound_id, cached))
+            return cached, 0.0
     
-    # Create output directory if it doesn't exist
-    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    start_time = time.time()
     
+    retry_count = ctx.retry_count
     attempts = 0
-    while attempts <= retry_count and not shutting_down:
+    while attempts <= retry_count and not ctx.shutdown.is_set():
         try:
-            api = await initialize_api()
-            sound = api.sound(id=sound_id)
-            sound_details = await sound.info()
+            await initialize_api(ctx)
+            await acquire_rate_limit_slot(ctx)
+            if ctx.shutdown.is_set():
+                break
+            sound_details = await asyncio.wait_for(fetch_sound_details(ctx, sound_id), timeout=REQ_TIMEOUT)
             
             elapsed = time.time() - start_time
-            last_request_time = time.time()
             
             logger.info(f"Retrieved sound info for {sound_id} in {elapsed:.2f} seconds")
+            remember_sound_info(ctx, sound_id, sound_details)
             
-            # Save to file with sound ID in filename
-            output_file = Path(output_dir) / f"sound_info_{sound_id}.json"
-            with open(output_file, "w") as f:
-                json.dump(sound_details, f, indent=4)
+            if ctx.jsonl_file is not None:
+                # Buffered until the next flush_jsonl()
+                ctx.jsonl_buffer.append(jsonl_line(sound_id, sound_details))
+            else:
+                # Save to file with sound ID in filename, serializing and writing
+                # on the default executor keeps the event loop free
+                await asyncio.get_running_loop().run_in_executor(
+                    None, write_sound_file, ctx.sound_file_path(sound_id), sound_details
+                )
                 
             return sound_details, elapsed
         
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
+            # asyncio.TimeoutError carries no message of its own
+            if isinstance(e, asyncio.TimeoutError):
+                error = f"timed out after {REQ_TIMEOUT:.0f} seconds"
+            else:
+                error = str(e)
             attempts += 1
-            if attempts <= retry_count and not shutting_down:
-                retry_delay = 1 * attempts
-                logger.warning(f"Error retrieving sound {sound_id}: {str(e)}. Retrying in {retry_delay}s... (Attempt {attempts}/{retry_count})")
-                await asyncio.sleep(retry_delay)
+            if attempts <= retry_count and not ctx.shutdown.is_set():
+                # Exponential backoff with jitter so failed requests don't retry in lockstep
+                retry_delay = min(MAX_RETRY_DELAY, (2 ** attempts) + random.random())
+                logger.warning(f"Error retrieving sound {sound_id}: {error}. Retrying in {retry_delay:.1f}s... (Attempt {attempts}/{retry_count})")
+                # Wake up early if a shutdown is requested while waiting
+                try:
+                    await asyncio.wait_for(ctx.shutdown.wait(), timeout=retry_delay)
+                except asyncio.TimeoutError:
+                    pass
             else:
                 elapsed = time.time() - start_time
-                logger.error(f"Failed to retrieve sound {sound_id} after {retry_count} retries: {str(e)} in {elapsed:.2f} seconds")
+                logger.error(f"Failed to retrieve sound {sound_id} after {retry_count} retries: {error} in {elapsed:.2f} seconds")
                 return None, elapsed
-
-async def process_multiple_sounds(sound_ids, max_sounds=None, output_csv=None, output_dir="sound_data"):
-    """Process multiple sound IDs sequentially, reusing the same session"""
-    global shutting_down
     
-    results = []
+    # Shutdown was requested before the sound could be retrieved
+    return None, time.time() - start_time
+
+async def flush_jsonl(ctx):
+    """Append the buffered lines to the JSON Lines file in one write"""
+    if ctx.jsonl_buffer:
+        lines, ctx.jsonl_buffer = ctx.jsonl_buffer, []
+        await ctx.jsonl_file.write(b"".join(lines))
+
+async def read_sound_ids(filename, count=None):
+    """Yield sound IDs from a file one at a time, stopping after count IDs if specified"""
+    n = 0
+    async with aiofiles.open(filename, "r") as f:
+        async for line in f:
+            sound_id = line.strip()
+            if not sound_id:
+                continue
+            if not sound_id.isdigit():
+                # Sound IDs are numeric, anything else would also corrupt the CSV rows
+                logger.warning(f"Skipping invalid sound ID {sound_id!r}")
+                continue
+            yield sound_id
+            n += 1
+            if count and count > 0 and n >= count:
+                break
+
+async def id_producer(ctx, filename, queue, count, num_workers):
+    """Feed sound IDs from a file into the queue, followed by one stop marker per worker"""
+    try:
+        async for sound_id in read_sound_ids(filename, count):
+            if ctx.shutdown.is_set():
+                break
+            await queue.put(sound_id)
+    finally:
+        for _ in range(num_workers):
+            await queue.put(None)
+
+async def process_multiple_sounds(ctx, filename, max_sounds=None, output_csv=None):
+    """Process the sound IDs from a file concurrently, reusing the pooled sessions
+
+    Returns:
+        tuple: The number of sounds processed and how many of them succeeded.
+    """
+    # Only counts are kept so memory stays flat however many IDs the file holds
+    processed_count = 0
+    success_count = 0
     total_start_time = time.time()
     
-    # Limit the number of sounds to process if specified
-    if max_sounds and max_sounds > 0:
-        sound_ids = sound_ids[:max_sounds]
-    
     # Create CSV file for results if specified
+    # None of the fields ever need quoting, so the rows are formatted by hand
     csv_file = None
-    csv_writer = None
     if output_csv:
         csv_file = open(output_csv, 'w', newline='')
-        csv_writer = csv.writer(csv_file)
-        csv_writer.writerow(['sound_id', 'timestamp', 'time_taken', 'success'])
+        csv_file.write("sound_id,timestamp,time_taken,success\n")
     
-    try:
-        for i, sound_id in enumerate(sound_ids):
-            if shutting_down:
-                logger.info(f"Shutdown requested, stopping after processing {i} sounds")
-                break
+    # The pipeline has three stages connected by queues: the producer reads IDs
+    # ahead into id_q, the workers fetch them and put their results on
+    # results_q, and a single writer saves the results in batches. Fetching,
+    # reading and writing overlap, and the workers never wait on the disk.
+    concurrency = ctx.concurrency
+    id_q = asyncio.Queue(maxsize=2 * concurrency)
+    results_q = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+    
+    def _flush(rows):
+        # Timestamps are only turned into readable dates when they are written
+        csv_file.write("".join(
+            f"{sound_id},{datetime.fromtimestamp(timestamp).isoformat()},{time_taken:.4f},{int(success)}\n"
+            for sound_id, timestamp, time_taken, success in rows
+        ))
+        csv_file.flush()
+    
+    async def writer():
+        """Write the results in batches until every worker has finished"""
+        rows_buf = []
+        # The flush currently running on the executor, if any
+        flushing = None
+        finished_workers = 0
+        last_flush = time.monotonic()
+        
+        async def flush_rows():
+            nonlocal rows_buf, flushing
+            rows, rows_buf = rows_buf, []
+            flushing = loop.run_in_executor(None, _flush, rows)
+            # Cancelling the writer must not abandon the thread still writing to the file
+            await asyncio.shield(flushing)
+        
+        try:
+            while finished_workers < concurrency:
+                try:
+                    row = await asyncio.wait_for(results_q.get(), timeout=RESULTS_FLUSH_INTERVAL / 2)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    if row is None:
+                        finished_workers += 1
+                    else:
+                        rows_buf.append(row)
                 
-            logger.info(f"Processing sound {i+1}/{len(sound_ids)}: {sound_id}")
-            result, time_taken = await sound_info(sound_id, output_dir=output_dir)
-            success = result is not None
-            timestamp = datetime.now().isoformat()
+                pending = len(rows_buf) + len(ctx.jsonl_buffer)
+                if pending and (pending >= RESULTS_BATCH_SIZE
+                                or time.monotonic() - last_flush > RESULTS_FLUSH_INTERVAL):
+                    if rows_buf:
+                        await flush_rows()
+                    await flush_jsonl(ctx)
+                    last_flush = time.monotonic()
             
-            results.append((sound_id, time_taken, success))
-            
-            # Write to CSV if enabled
-            if csv_writer:
-                csv_writer.writerow([sound_id, timestamp, time_taken, success])
-                csv_file.flush()  # Ensure data is written immediately
+            if rows_buf:
+                await flush_rows()
+            await flush_jsonl(ctx)
+        finally:
+            if flushing is not None and not flushing.done():
+                # Let the interrupted flush finish before the file is written to or closed
+                await asyncio.wait([flushing])
+            # Write whatever is still buffered so no rows are lost on shutdown
+            if rows_buf:
+                _flush(rows_buf)
+    
+    def record(sound_id, result, time_taken):
+        nonlocal processed_count, success_count
+        success = result is not None
+        timestamp = time.time()
+        
+        processed_count += 1
+        success_count += success
+        # The file may hold fewer IDs than requested, so the count is only an upper bound
+        total = f" (of at most {max_sounds})" if max_sounds and max_sounds > 0 else ""
+        logger.info(f"Processed sound {processed_count}{total}: {sound_id}")
+        
+        # Write to CSV if enabled
+        if csv_file:
+            results_q.put_nowait([sound_id, timestamp, time_taken, success])
+    
+    async def worker():
+        try:
+            while (sound_id := await id_q.get()) is not None:
+                result, time_taken = await sound_info(ctx, sound_id)
+                if ctx.shutdown.is_set() and result is None:
+                    # Sounds skipped because of the shutdown are not recorded
+                    continue
+                record(sound_id, result, time_taken)
+        finally:
+            # Tell the writer this worker is done
+            results_q.put_nowait(None)
+    
+    # The bounded id_q makes the producer wait for the workers instead of reading
+    # the whole file, and each worker handles one request at a time, which bounds
+    # the requests in flight without creating a task per ID
+    producer = asyncio.create_task(id_producer(ctx, filename, id_q, max_sounds, concurrency))
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    writer_task = asyncio.create_task(writer())
+    
+    try:
+        await asyncio.gather(producer, *workers, writer_task)
         
         total_time = time.time() - total_start_time
-        processed_count = len(results)
         
         if processed_count > 0:
             logger.info(f"\nProcessed {processed_count} sounds in {total_time:.2f} seconds")
             logger.info(f"Average time per sound: {total_time/processed_count:.2f} seconds")
             
             # Print summary of results
-            success_count = sum(1 for _, _, success in results if success)
             success_rate = (success_count/processed_count*100) if processed_count > 0 else 0
             logger.info(f"Success rate: {success_count}/{processed_count} ({success_rate:.1f}%)")
         
-        return results
+        return processed_count, success_count
     finally:
+        for task in [producer, *workers, writer_task]:
+            task.cancel()
+        # Let the writer write out its buffered rows before the file is closed
+        await asyncio.gather(writer_task, return_exceptions=True)
         if csv_file:
             csv_file.close()
 
-def load_sound_ids_from_file(filename):
-    """Load sound IDs from a file"""
-    sound_ids = []
-    with open(filename, "r") as f:
-        for line in f:
-            sound_id = line.strip()
-            if sound_id:
-                sound_ids.append(sound_id)
-    return sound_ids
+def positive_int(value):
+    """argparse type for options that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
 
 async def main():
     """Main function that handles both the API call and cleanup"""
-    global api_instance, shutting_down
     
     parser = argparse.ArgumentParser(description="Retrieve TikTok sound information efficiently")
     group = parser.add_mutually_exclusive_group()
@@ -216,44 +633,86 @@ async def main():
     group.add_argument("--file", nargs=2, metavar=("FILENAME", "COUNT"), help="Process N sounds from the specified file")
     
     parser.add_argument("--output-dir", default="sound_data", help="Directory to save sound data (default: sound_data)")
+    parser.add_argument("--jsonl", nargs="?", const="sound_info.jsonl", metavar="FILE",
+                        help="Append results to a single JSON Lines file (default: sound_info.jsonl)")
     parser.add_argument("--retry", type=int, default=1, help="Number of retries for failed requests (default: 1)")
+    parser.add_argument("--force", action="store_true",
+                        help="Fetch every sound again, even if it was saved recently")
+    parser.add_argument("--sessions", type=positive_int, default=NUM_SESSIONS,
+                        help=f"Number of browser sessions signing the requests (default: {NUM_SESSIONS})")
+    parser.add_argument("--concurrency", type=positive_int, default=CONCURRENCY,
+                        help=f"Maximum number of requests in flight at once (default: {CONCURRENCY})")
     
     args = parser.parse_args()
     
+    ctx = PipelineCtx(output_dir=args.output_dir, retry_count=args.retry, force=args.force,
+                      concurrency=args.concurrency)
+    
+    # Deliver signals through the event loop so shutdown is observed at the next await
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, ctx.request_shutdown)
+        except NotImplementedError:
+            # Windows event loops don't support signal handlers
+            signal.signal(sig, lambda sig, frame: loop.call_soon_threadsafe(ctx.request_shutdown))
+    
+    # Every worker may have one file write running at a time
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=args.concurrency))
+    
     try:
+        # Create output directory if it doesn't exist
+        Path(ctx.output_dir).mkdir(parents=True, exist_ok=True)
+        
+        if args.jsonl:
+            ctx.jsonl_file = await aiofiles.open(args.jsonl, "ab")
+        
+        # Create the sessions before any requests fan out
+        await initialize_api(ctx, args.sessions)
+        
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_csv = f"sound_results_{timestamp}.csv"
         
         if args.batch:
             # Process sounds from the default CSV file
-            sound_ids = load_sound_ids_from_file("sounds_ids.csv")
-            await process_multiple_sounds(sound_ids, args.batch, output_csv, args.output_dir)
+            await process_multiple_sounds(ctx, "sounds_ids.csv", args.batch, output_csv)
         elif args.file:
             # Process sounds from a specific file
             filename, count = args.file
-            sound_ids = load_sound_ids_from_file(filename)
-            await process_multiple_sounds(sound_ids, int(count), output_csv, args.output_dir)
+            await process_multiple_sounds(ctx, filename, int(count), output_csv)
         elif args.sound_id:
             # Process a single sound ID
-            result, time_taken = await sound_info(args.sound_id, args.retry, args.output_dir)
+            result, time_taken = await sound_info(ctx, args.sound_id)
             logger.info(f"Total time: {time_taken:.2f} seconds")
         else:
             # Default sound ID if none provided
             sound_id = "10104523"
-            result, time_taken = await sound_info(sound_id, args.retry, args.output_dir)
+            result, time_taken = await sound_info(ctx, sound_id)
             logger.info(f"Total time: {time_taken:.2f} seconds")
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
     finally:
         # Clean up resources
-        if api_instance:
+        if ctx.jsonl_file is not None:
+            await flush_jsonl(ctx)
+            await ctx.jsonl_file.close()
+        if ctx.api:
             try:
                 logger.info("Cleaning up resources...")
-                await api_instance.close_sessions()
-                await api_instance.stop_playwright()
+                if ctx.http_client:
+                    await ctx.http_client.aclose()
+                await ctx.api.close_sessions()
+                await ctx.api.stop_playwright()
                 logger.info("Cleanup completed")
             except Exception as e:
                 logger.error(f"Error during cleanup: {str(e)}")
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    if uvloop is None:
+        asyncio.run(main())
+    elif sys.version_info >= (3, 11):
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            runner.run(main())
+    else:
+        uvloop.install()
+        asyncio.run(main()) 
\ No newline at end of file
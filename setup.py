@@ -19,6 +19,9 @@ setuptools.setup(
     download_url="https://github.com/davidteather/TikTok-Api/tarball/main",
     keywords=["tiktok", "python3", "api", "unofficial", "tiktok-api", "tiktok api"],
     install_requires=["requests", "playwright", "httpx"],
+    extras_require={
+        "examples": ["aiofiles", "orjson", "uvloop; sys_platform != 'win32'"],
+    },
     classifiers=[
         "Development Status :: 4 - Beta",
         "Intended Audience :: Developers",